@@ -10,10 +10,12 @@ import shutil
 import copy
 import multiprocessing
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
-from quarkball.utils import Network, Caching, jit
+from quarkball.utils import (
+    Network, Caching, CachingBits, jit, _random_fill_serial, _crossover)
 
 
 # random.seed(0)
@@ -36,6 +38,26 @@ def _random_cache(videos, avail_cache, min_video_size=None):
     return cache
 
 
+# ======================================================================
+def _sorted_requests(network):
+    """
+    Sort the requests by number of requests divided by video size.
+
+    Args:
+        network (Network): The network.
+
+    Returns:
+        sorted_requests (list[tuple]): The sorted (video, endpoint, num).
+    """
+    # key=lambda x: x[2])[::-1]
+    keys = network.request_nums / network.videos[network.request_endpoints]
+    order = np.argsort(-keys, kind='stable')
+    return list(zip(
+        network.request_videos[order].tolist(),
+        network.request_endpoints[order].tolist(),
+        network.request_nums[order].tolist()))
+
+
 # ======================================================================
 def _breeding(pool, network, crossover=0.5, mutation_rate=0.1, mutation=0.01):
     pool = sorted(pool, key=operator.itemgetter(0), reverse=True)
@@ -60,22 +82,104 @@ def _breeding(pool, network, crossover=0.5, mutation_rate=0.1, mutation=0.01):
     return score, caching
 
 
+# ======================================================================
+def _breeding_bits(
+        pool, network, crossover=0.5, mutation_rate=0.1, mutation=0.01):
+    """
+    Breed a new caching from the best two bit cachings of a pool.
+
+    This is the same as `_breeding()`, except that crossover, mutation and
+    scoring run on the caching matrix with the compiled kernels, which
+    release the GIL, so that many offspring can be bred on a thread pool
+    sharing the same network.
+
+    Args:
+        pool (list[tuple]): The parents as (score, CachingBits).
+        network (Network): The network.
+        crossover (float): The fraction of caches kept from the best parent.
+        mutation_rate (float): The mutation threshold.
+        mutation (float): The fraction of caches refilled on mutation.
+
+    Returns:
+        result (tuple): The tuple
+            contains:
+             - score (int): The score.
+             - caching (CachingBits): The offspring.
+    """
+    pool = sorted(pool, key=operator.itemgetter(0), reverse=True)
+    matrix = pool[0][1].matrix
+    num_caches = network.num_caches
+    if crossover is None:
+        raise NotImplementedError('Dynamic recombination not implemented!')
+    else:
+        # crossover
+        _crossover(
+            matrix, pool[1][1].matrix,
+            np.random.permutation(num_caches)[
+                :int(num_caches * (1 - crossover))])
+
+        # mutation
+        if random.random() >= mutation_rate:
+            _random_fill_serial(
+                matrix,
+                np.random.permutation(num_caches)[:int(num_caches * mutation)],
+                network.videos, network.cache_size)
+    return network.score_matrix(matrix, serial=True), CachingBits(matrix)
+
+
+# ======================================================================
+def _random_matrix(network):
+    """
+    Generate a random caching matrix and compute its score.
+
+    The compiled kernels release the GIL, so that this can run on a
+    thread pool sharing the same network.
+
+    Args:
+        network (Network): The network.
+
+    Returns:
+        result (tuple): The tuple
+            contains:
+             - score (int): The score.
+             - matrix (np.ndarray): The (num_caches, num_videos) matrix.
+    """
+    matrix = np.zeros((network.num_caches, network.num_videos), dtype=bool)
+    _random_fill_serial(
+        matrix, np.arange(network.num_caches), network.videos,
+        network.cache_size)
+    return network.score_matrix(matrix, serial=True), matrix
+
+
 # ======================================================================
 class CachingRandomPar(Caching):
     def __init__(self, *args, **kwargs):
         Caching.__init__(self, *args, **kwargs)
 
     # ----------------------------------------------------------
-    def fill(self, network):
-        min_video_size = np.min(network.videos)
-        mp_pool = multiprocessing.Pool(multiprocessing.cpu_count())
-        results = [
-            mp_pool.apply_async(
-                _random_cache,
-                (network.videos, network.cache_size, min_video_size))
-            for i in range(self.num_caches)]
-        self.caches = [result.get() for result in results]
-        mp_pool = None
+    def fill(self, network, threads=False):
+        if threads:
+            # each thread fills a disjoint chunk of the caches in-place
+            num_workers = multiprocessing.cpu_count()
+            matrix = np.zeros(
+                (network.num_caches, network.num_videos), dtype=bool)
+            with ThreadPoolExecutor(num_workers) as executor:
+                list(executor.map(
+                    lambda caches: _random_fill_serial(
+                        matrix, caches, network.videos, network.cache_size),
+                    np.array_split(
+                        np.arange(network.num_caches), num_workers)))
+            self.caches = CachingBits(matrix).caches
+        else:
+            min_video_size = np.min(network.videos)
+            mp_pool = multiprocessing.Pool(multiprocessing.cpu_count())
+            results = [
+                mp_pool.apply_async(
+                    _random_cache,
+                    (network.videos, network.cache_size, min_video_size))
+                for i in range(self.num_caches)]
+            self.caches = [result.get() for result in results]
+            mp_pool = None
 
 
 # ======================================================================
@@ -105,7 +209,8 @@ class CachingMonteCarlo(Caching):
         Caching.__init__(self, *args, **kwargs)
 
     # ----------------------------------------------------------
-    def fill(self, network, filepath=None, max_iter=int(1e10)):
+    def fill(
+            self, network, filepath=None, max_iter=int(1e10), threads=False):
         filename = os.path.basename(filepath)
         if os.path.isfile(filepath):
             curr_caching = Caching.load(filepath)
@@ -114,27 +219,53 @@ class CachingMonteCarlo(Caching):
                 filename, curr_score), flush=True)
         else:
             curr_score = 0
+        if threads:
+            num_workers = multiprocessing.cpu_count()
+            executor = ThreadPoolExecutor(num_workers)
+            # built once, before sharing the network among the threads
+            kernel_args = network.kernel_args
+        else:
+            executor = None
+        results = []
         begin_time = datetime.datetime.now()
         j = 0
-        while j < max_iter:
-            min_video_size = np.min(network.videos)
-            self.caches = [
-                _random_cache(
-                    network.videos, network.cache_size, min_video_size)
-                for i in range(self.num_caches)]
-            score = self.score(network)
-            end_time = datetime.datetime.now()
-            print('montecarlo - {:20s} SCORE: {:7d}  ({})  j={}, t={}'.format(
-                filename, score, curr_score, j, end_time - begin_time),
-                flush=True)
-            begin_time = end_time
-            if score > curr_score:
-                curr_score = score
-                best_caches = self.caches
-                print('montecarlo partial best - {:20s} SCORE: {}'.format(
-                    filename, score), flush=True)
-                self.save(filepath)
-            j += 1
+        try:
+            while j < max_iter:
+                if threads:
+                    # random cachings are generated and scored in batches
+                    if not results:
+                        results = list(executor.map(
+                            _random_matrix,
+                            [network] * min(num_workers, max_iter - j)))[::-1]
+                    score, matrix = results.pop()
+                else:
+                    min_video_size = np.min(network.videos)
+                    self.caches = [
+                        _random_cache(
+                            network.videos, network.cache_size,
+                            min_video_size)
+                        for i in range(self.num_caches)]
+                    score = self.score(network)
+                end_time = datetime.datetime.now()
+                print(
+                    'montecarlo - {:20s} SCORE: {:7d}  ({})  j={}, t={}'
+                    .format(
+                        filename, score, curr_score, j,
+                        end_time - begin_time),
+                    flush=True)
+                begin_time = end_time
+                if score > curr_score:
+                    curr_score = score
+                    if threads:
+                        self.caches = CachingBits(matrix).caches
+                    best_caches = self.caches
+                    print('montecarlo partial best - {:20s} SCORE: {}'.format(
+                        filename, score), flush=True)
+                    self.save(filepath)
+                j += 1
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
 
 
 # ======================================================================
@@ -191,7 +322,8 @@ class CachingEvolution(Caching):
             mutation_rate=0.05,
             mutation=0.1,
             elitism=0.005,
-            multiproc=True):
+            multiproc=True,
+            threads=False):
         dirpath = os.path.dirname(filepath)
         filename = os.path.basename(filepath)
         basename = os.path.splitext(filename)[0]
@@ -224,65 +356,89 @@ class CachingEvolution(Caching):
                 for name in pool_filenames]
 
         pool = sorted(pool, key=operator.itemgetter(0), reverse=True)
+        if threads:
+            # the threads share the network and breed bit cachings
+            pool = [
+                (score, CachingBits.from_caching(caching, network.num_videos))
+                for score, caching in pool]
+            # built once, before sharing the network among the threads
+            kernel_args = network.kernel_args
+            executor = ThreadPoolExecutor(multiprocessing.cpu_count())
+        else:
+            executor = None
 
         begin_time = datetime.datetime.now()
         generation = 0
         best_score = pool[0][0]
         mp_pool = multiprocessing.Pool(multiprocessing.cpu_count()) \
-            if multiproc else None
-        while generation < max_generations:
-            # selection
-            selected = pool[:int(pool_size * selection)]
-
-            # elitism
-            elite = copy.deepcopy(pool[:int(pool_size * elitism) + 1])
-
-            # crossover and mutate
-            num_generators = 2
-
-            if multiproc:
-                results = [
-                    mp_pool.apply_async(
-                        _breeding,
-                        ([selected[i] for i in sorted(random.sample(
-                            range(len(selected)), num_generators))],
-                         network, crossover, mutation_rate, mutation))
-                    for _ in range(pool_size - len(elite))]
-                offspring = [result.get() for result in results]
-            else:
-                offspring = [
-                    _breeding([selected[i] for i in sorted(random.sample(
-                        range(len(selected)), num_generators))], network,
-                              crossover, mutation_rate, mutation)
-                    for _ in range(pool_size - len(elite))]
-            pool = elite + offspring
-
-            # delete old generation
-            if os.path.isdir(old_evo_dirpath):
-                shutil.rmtree(old_evo_dirpath, ignore_errors=True)
-                shutil.rmtree(old_evo_dirpath, ignore_errors=True)
-            shutil.move(evo_dirpath, old_evo_dirpath)
-            os.makedirs(evo_dirpath)
-
-            # save new generation
-            pool = sorted(pool, key=operator.itemgetter(0), reverse=True)
-            [caching.save(
-                os.path.join(evo_dirpath,
-                             '{:07d}_id{:04d}_gen{:06d}__'.format(
-                                 score, i, generation) + filename))
-             for i, (score, caching) in enumerate(pool)]
-
-            if pool[0][0] > best_score:
-                pool[0][1].save(filepath)
-                best_score = pool[0][0]
-
-            end_time = datetime.datetime.now()
-            print('evolution - {:20s} SCORE: {:7d}, gen={}, t={}'.format(
-                filename, best_score, generation, end_time - begin_time),
-                flush=True)
-            begin_time = end_time
-
-            generation += 1
+            if multiproc and not threads else None
+        try:
+            while generation < max_generations:
+                # selection
+                selected = pool[:int(pool_size * selection)]
+
+                # elitism
+                elite = copy.deepcopy(pool[:int(pool_size * elitism) + 1])
+
+                # crossover and mutate
+                num_generators = 2
+
+                if threads:
+                    results = [
+                        executor.submit(
+                            _breeding_bits,
+                            [selected[i] for i in sorted(random.sample(
+                                range(len(selected)), num_generators))],
+                            network, crossover, mutation_rate, mutation)
+                        for _ in range(pool_size - len(elite))]
+                    offspring = [result.result() for result in results]
+                elif multiproc:
+                    results = [
+                        mp_pool.apply_async(
+                            _breeding,
+                            ([selected[i] for i in sorted(random.sample(
+                                range(len(selected)), num_generators))],
+                             network, crossover, mutation_rate, mutation))
+                        for _ in range(pool_size - len(elite))]
+                    offspring = [result.get() for result in results]
+                else:
+                    offspring = [
+                        _breeding([selected[i] for i in sorted(random.sample(
+                            range(len(selected)), num_generators))], network,
+                                  crossover, mutation_rate, mutation)
+                        for _ in range(pool_size - len(elite))]
+                pool = elite + offspring
+
+                # delete old generation
+                if os.path.isdir(old_evo_dirpath):
+                    shutil.rmtree(old_evo_dirpath, ignore_errors=True)
+                    shutil.rmtree(old_evo_dirpath, ignore_errors=True)
+                shutil.move(evo_dirpath, old_evo_dirpath)
+                os.makedirs(evo_dirpath)
+
+                # save new generation
+                pool = sorted(pool, key=operator.itemgetter(0), reverse=True)
+                [caching.save(
+                    os.path.join(evo_dirpath,
+                                 '{:07d}_id{:04d}_gen{:06d}__'.format(
+                                     score, i, generation) + filename))
+                 for i, (score, caching) in enumerate(pool)]
+
+                if pool[0][0] > best_score:
+                    pool[0][1].save(filepath)
+                    best_score = pool[0][0]
+
+                end_time = datetime.datetime.now()
+                print('evolution - {:20s} SCORE: {:7d}, gen={}, t={}'.format(
+                    filename, best_score, generation, end_time - begin_time),
+                    flush=True)
+                begin_time = end_time
+
+                generation += 1
+
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
 
         # return best result
         self.caches = pool[0][1].caches
@@ -295,30 +451,24 @@ class CachingOptimByRequests(Caching):
 
     # ----------------------------------------------------------
     def fill(self, network):
-        # sort requests by number of requests divided by video size
-        sorted_requests = sorted(
-            network.requests,
-            key=lambda x: x[2] / network.videos[x[1]], reverse=True)
-        # key=lambda x: x[2])[::-1]
+        sorted_requests = _sorted_requests(network)
         # min_video_size = np.min(network.videos)
         free_caches = np.ones(network.num_caches) * network.cache_size
-        cached_requests = []
+        cached_requests = set()
         for request in sorted_requests:
             if request not in cached_requests:
                 new_video, endpoint, num = request
-                # sorted_caches = np.argsort(
-                #     network.cache_latencies[endpoint, :])
-                sorted_caches = np.argsort(
-                    network.cache_latencies[endpoint, :] / (free_caches + 1))
-                sorted_caches = sorted_caches[
-                    network.cache_latencies[endpoint, :] > 0]
+                # only consider the caches connected to the endpoint
+                link_caches, link_latencies = network.links(endpoint)
+                sorted_caches = link_caches[np.argsort(
+                    link_latencies / (free_caches[link_caches] + 1))]
                 for i in list(sorted_caches):
                     video_size = network.videos[new_video]
                     if (video_size <= free_caches[i] and
                                 new_video not in self.caches[i]):
                         self.caches[i].add(new_video)
                         free_caches[i] -= video_size
-                        cached_requests.append(request)
+                        cached_requests.add(request)
 
 
 # ======================================================================
@@ -328,14 +478,10 @@ class CachingOptimByCaches(Caching):
 
     # ----------------------------------------------------------
     def fill(self, network):
-        # sort requests by number of requests divided by video size
-        sorted_requests = sorted(
-            network.requests,
-            key=lambda x: x[2] / network.videos[x[1]], reverse=True)
-        # key=lambda x: x[2])[::-1]
+        sorted_requests = _sorted_requests(network)
         min_video_size = np.min(network.videos)
         free_caches = np.ones(network.num_caches) * network.cache_size
-        cached_requests = []
+        cached_requests = set()
         for i, cache in enumerate(self.caches):
             for request in sorted_requests:
                 if request not in cached_requests:
@@ -345,6 +491,6 @@ class CachingOptimByCaches(Caching):
                                 new_video not in cache):
                         cache.add(new_video)
                         free_caches[i] -= video_size
-                        cached_requests.append(request)
+                        cached_requests.add(request)
                 if free_caches[i] < min_video_size:
                     break
@@ -9,24 +9,160 @@ quarkball2017: base classes
 from __future__ import (
     division, absolute_import, print_function, unicode_literals)
 
+import os
 import random
+import shutil
 import multiprocessing
+from multiprocessing import shared_memory
 import numpy as np
 
 try:
-    from numba import jit
+    from numba import jit, njit, prange
 except ImportError:
     print('E: Numba not found!')
+    HAS_NUMBA = False
 
 
-    def jit(_):
-        return _
+    def jit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        else:
+            return lambda func: func
+
+
+    njit = jit
+    prange = range
 else:
     print('I: Using Numba!')
+    HAS_NUMBA = True
+
+
+# ======================================================================
+def _file_key(filepath):
+    """
+    Compute the key identifying the current version of a file.
+
+    Args:
+        filepath (str): The file path.
+
+    Returns:
+        key (tuple[int]): The modification time (in ns) and the size.
+    """
+    stat = os.stat(filepath)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# ======================================================================
+def _as_min_int(arr):
+    """
+    Convert to 32-bit integers if the values allow it, else to 64-bit.
+
+    Arrays that already have the target type are not copied.
+
+    Args:
+        arr (np.ndarray): The input array.
+
+    Returns:
+        arr (np.ndarray): The integer array.
+    """
+    arr = np.asarray(arr)
+    int32_info = np.iinfo(np.int32)
+    if arr.size == 0 or (
+            arr.min() >= int32_info.min and arr.max() <= int32_info.max):
+        dtype = np.int32
+    else:
+        dtype = np.int64
+    return arr if arr.dtype == dtype else arr.astype(dtype)
+
+
+# ======================================================================
+def _merge_requests(
+        request_videos, request_endpoints, request_nums, num_endpoints):
+    """
+    Merge the requests for the same (video, endpoint) pair.
+
+    Args:
+        request_videos (np.ndarray): The requested video IDs.
+        request_endpoints (np.ndarray): The requesting endpoints.
+        request_nums (np.ndarray): The number of requests.
+        num_endpoints (int): The number of endpoints.
+
+    Returns:
+        result (tuple[np.ndarray]): The merged requests columns.
+            The requests are sorted by video and endpoint.
+    """
+    keys, inverse = np.unique(
+        np.asarray(request_videos, dtype=np.int64) * num_endpoints +
+        request_endpoints, return_inverse=True)
+    request_nums = np.bincount(
+        inverse.ravel(), weights=request_nums,
+        minlength=len(keys)).astype(np.int64)
+    request_videos, request_endpoints = np.divmod(keys, num_endpoints)
+    return request_videos, request_endpoints, request_nums
+
+
+# ======================================================================
+def _packed_nonzero(bits):
+    """
+    Find the indexes of the set bits of a bit matrix packed on the last axis.
+
+    This only unpacks the non-zero bytes, and it is therefore much faster
+    than `np.nonzero(np.unpackbits(bits, axis=-1))` for sparse matrices.
+
+    The padding bits of the packed last axis are assumed to be zero.
+
+    Args:
+        bits (np.ndarray): The packed bit matrix.
+
+    Returns:
+        result (tuple[np.ndarray]): The indexes of the set bits.
+    """
+    indexes = np.nonzero(bits)
+    set_bytes, set_bits = np.nonzero(
+        np.unpackbits(bits[indexes][:, None], axis=1))
+    result = tuple(index[set_bytes] for index in indexes[:-1])
+    last = indexes[-1][set_bytes] * 8 + set_bits
+    return result + (last,)
+
+
+# ======================================================================
+def _links_from_latencies(cache_latencies):
+    """
+    Compute the sparse (CSR) endpoint-to-cache links.
+
+    Args:
+        cache_latencies (np.ndarray): The cache latency of endpoints.
+            First dim goes through endpoints.
+            Second dim goes through caches.
+            Zero values indicate that the cache is not connected.
+
+    Returns:
+        result (tuple): The tuple
+            contains:
+             - link_ptrs (np.ndarray): The links offsets for each endpoint.
+               The links of endpoint `i` are in `[ptrs[i], ptrs[i + 1])`.
+             - link_caches (np.ndarray): The linked cache of each link.
+             - link_latencies (np.ndarray): The latency of each link.
+    """
+    endpoints, link_caches = np.nonzero(cache_latencies)
+    link_ptrs = np.zeros(cache_latencies.shape[0] + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(endpoints, minlength=cache_latencies.shape[0]),
+        out=link_ptrs[1:])
+    link_latencies = np.asarray(cache_latencies)[endpoints, link_caches]
+    return link_ptrs, link_caches.astype(np.int32), link_latencies
 
 
 # ======================================================================
 class Network(object):
+    # arrays stored in the binary cache
+    BIN_ARRAYS = (
+        'videos', 'endpoint_latencies', 'cache_latencies',
+        'request_videos', 'request_endpoints', 'request_nums')
+    # increase whenever the binary cache layout changes
+    BIN_VERSION = 2
+    BIN_EXT = '.cache'
+
     def __init__(
             self,
             videos,
@@ -46,17 +182,56 @@ class Network(object):
             cache_latencies (np.ndarray): The cache latency of endpoints.
                 First dim goes through endpoints.
                 Second dim goes through caches.
-            requests (list[tuple]): The list of requests.
-                Each tuple contains:
+                Zero values indicate that the cache is not connected.
+                The connected caches are also available as sparse (CSR)
+                links through `link_ptrs`, `link_caches` and
+                `link_latencies` (see also `links()`).
+            requests (list[tuple]|np.ndarray): The list of requests.
+                Each tuple (or row) contains:
                 - the video ID;
                 - the requesting endpoint;
                 - the number of requests.
+                The requests are stored as the typed column arrays
+                `request_videos`, `request_endpoints` and `request_nums`.
         """
         self.videos = videos
         self.endpoint_latencies = endpoint_latencies
         self.cache_size = cache_size
         self.cache_latencies = cache_latencies
-        self._requests = requests
+        self.requests = requests if requests is not None else []
+        # only set by `reduce()`: see `total_requests` and `video_ids`
+        self._total_requests = None
+        self.video_ids = None
+
+    # ----------------------------------------------------------
+    @property
+    def cache_latencies(self):
+        return self._cache_latencies
+
+    # ----------------------------------------------------------
+    @cache_latencies.setter
+    def cache_latencies(self, value):
+        self._cache_latencies = value
+        self.link_ptrs, self.link_caches, self.link_latencies = \
+            _links_from_latencies(value)
+        self._lazy = {}
+
+    # ----------------------------------------------------------
+    def links(self, endpoint):
+        """
+        Get the caches connected to an endpoint.
+
+        Args:
+            endpoint (int): The endpoint ID.
+
+        Returns:
+            result (tuple[np.ndarray]): The tuple
+                contains:
+                 - link_caches (np.ndarray): The connected caches.
+                 - link_latencies (np.ndarray): The corresponding latencies.
+        """
+        begin, end = self.link_ptrs[endpoint], self.link_ptrs[endpoint + 1]
+        return self.link_caches[begin:end], self.link_latencies[begin:end]
 
     # ----------------------------------------------------------
     @property
@@ -71,22 +246,105 @@ class Network(object):
     # ----------------------------------------------------------
     @property
     def num_caches(self):
-        return self.cache_latencies.shape[1]
+        return self._cache_latencies.shape[1]
 
     # ----------------------------------------------------------
     @property
     def num_requests(self):
-        return len(self.requests)
+        return len(self.request_videos)
+
+    # ----------------------------------------------------------
+    @property
+    def num_links(self):
+        return len(self.link_caches)
+
+    # ----------------------------------------------------------
+    @property
+    def total_requests(self):
+        """
+        The total number of requests used for normalizing the score.
+
+        For reduced networks, this is the value of the original network.
+        """
+        if self._total_requests is None:
+            return int(np.sum(self.request_nums, dtype=np.int64))
+        else:
+            return self._total_requests
 
     # ----------------------------------------------------------
     @property
     def requests(self):
+        """
+        The requests as a list of (video, endpoint, num) tuples.
+
+        This is only a (lazily computed) view for compatibility:
+        use `request_videos`, `request_endpoints` and `request_nums` instead.
+        """
+        if self._requests is None:
+            self._requests = list(zip(
+                self.request_videos.tolist(),
+                self.request_endpoints.tolist(),
+                self.request_nums.tolist()))
         return self._requests
 
     # ----------------------------------------------------------
     @requests.setter
     def requests(self, value):
-        self._requests = value
+        value = np.asarray(value, dtype=np.int64).reshape(-1, 3)
+        self.set_requests(value[:, 0], value[:, 1], value[:, 2])
+
+    # ----------------------------------------------------------
+    def set_requests(self, request_videos, request_endpoints, request_nums):
+        """
+        Set the requests from the column arrays.
+
+        The arrays are stored as 32-bit integers if their values allow it.
+
+        Args:
+            request_videos (np.ndarray): The requested video IDs.
+            request_endpoints (np.ndarray): The requesting endpoints.
+            request_nums (np.ndarray): The number of requests.
+
+        Returns:
+            None.
+        """
+        self.request_videos = _as_min_int(request_videos)
+        self.request_endpoints = _as_min_int(request_endpoints)
+        self.request_nums = _as_min_int(request_nums)
+        self._requests = None
+        self._lazy = {}
+
+    # ----------------------------------------------------------
+    def requests_by_video(self):
+        """
+        Get the requests grouped by video.
+
+        Returns:
+            result (tuple[np.ndarray]): The tuple
+                contains:
+                 - ptrs (np.ndarray): The offsets for each video.
+                   The requests for video `i` are `order[ptrs[i]:ptrs[i + 1]]`.
+                 - order (np.ndarray): The request indexes sorted by video.
+        """
+        if 'requests_by_video' not in self._lazy:
+            order = np.argsort(self.request_videos, kind='stable')
+            ptrs = np.zeros(self.num_videos + 1, dtype=np.int64)
+            np.cumsum(
+                np.bincount(self.request_videos, minlength=self.num_videos),
+                out=ptrs[1:])
+            self._lazy['requests_by_video'] = ptrs, order
+        return self._lazy['requests_by_video']
+
+    # ----------------------------------------------------------
+    @property
+    def request_latencies(self):
+        """
+        The datacenter latency of each request.
+        """
+        if 'request_latencies' not in self._lazy:
+            self._lazy['request_latencies'] = np.asarray(
+                self.endpoint_latencies)[self.request_endpoints]
+        return self._lazy['request_latencies']
 
     # ----------------------------------------------------------
     def __str__(self):
@@ -102,27 +360,142 @@ class Network(object):
 
     # ----------------------------------------------------------
     @classmethod
-    def load(cls, filepath):
-        with open(filepath, 'r') as file:
-            num_videos, num_endpoints, num_requests, num_caches, cache_size = [
-                int(val) for val in file.readline().split()]
-            videos = np.array([int(v) for v in file.readline().split()])
-            endpoint_latencies = np.zeros(num_endpoints)
-            cache_latencies = np.zeros((num_endpoints, num_caches))
-            for i in range(num_endpoints):
-                endpoint_latencies[i], lines_to_read = [
-                    int(val) for val in file.readline().split()]
-                for j in range(lines_to_read):
-                    k, latency = [int(v) for v in file.readline().split()]
-                    cache_latencies[i, k] = latency
-            requests = []
-            for i in range(num_requests):
-                requests.append(
-                    tuple(int(val) for val in file.readline().split()))
+    def load(cls, filepath, cached=True):
+        """
+        Load the network from a text input file.
+
+        The whole file is tokenized in a single pass into a flat integer
+        buffer, from which the different sections are sliced.
+
+        If `cached` is True, a binary copy of the network is stored next to
+        the input file (in `filepath + Network.BIN_EXT`) the first time,
+        keyed on the input file modification time and size.
+        Later loads memory-map the binary copy instead of parsing the text,
+        so that multiple processes share the same physical pages.
+
+        Args:
+            filepath (str): The input file path.
+            cached (bool): Use (and create if needed) the binary cache.
+
+        Returns:
+            network (Network): The loaded network.
+        """
+        if cached:
+            bin_dirpath = filepath + cls.BIN_EXT
+            key = _file_key(filepath)
+            self = cls.load_bin(bin_dirpath, key)
+            if self is None:
+                self = cls.from_tokens(
+                    np.fromfile(filepath, dtype=np.int64, sep=' '))
+                try:
+                    self.save_bin(bin_dirpath, key)
+                except OSError:
+                    print('W: Cannot write binary cache `{}`'.format(
+                        bin_dirpath))
+        else:
+            self = cls.from_tokens(
+                np.fromfile(filepath, dtype=np.int64, sep=' '))
+        return self
+
+    # ----------------------------------------------------------
+    @classmethod
+    def from_tokens(cls, tokens):
+        """
+        Generate the network from the flat integer tokens of an input file.
+
+        Args:
+            tokens (np.ndarray): The integer tokens of the input file.
+
+        Returns:
+            network (Network): The generated network.
+        """
+        num_videos, num_endpoints, num_requests, num_caches, cache_size = [
+            int(val) for val in tokens[:5]]
+        i = 5
+        videos = tokens[i:i + num_videos].copy()
+        i += num_videos
+        endpoint_latencies = np.zeros(num_endpoints)
+        cache_latencies = np.zeros((num_endpoints, num_caches))
+        for j in range(num_endpoints):
+            endpoint_latencies[j], num_links = tokens[i:i + 2]
+            i += 2
+            links = tokens[i:i + 2 * num_links].reshape(-1, 2)
+            i += 2 * num_links
+            cache_latencies[j, links[:, 0]] = links[:, 1]
+        requests = tokens[i:i + 3 * num_requests].reshape(-1, 3)
         self = cls(
             videos, endpoint_latencies, cache_size, cache_latencies, requests)
         return self
 
+    # ----------------------------------------------------------
+    @classmethod
+    def load_bin(cls, dirpath, key=None):
+        """
+        Load the network from its binary form (memory-mapped).
+
+        Args:
+            dirpath (str): The directory containing the binary form.
+            key (tuple[int]|None): The expected key of the source file.
+                If None, the key is not checked.
+
+        Returns:
+            network (Network|None): The loaded network.
+                If the binary form is missing, outdated or does not match
+                the key, None is returned.
+        """
+        meta_filepath = os.path.join(dirpath, 'meta.npy')
+        if not os.path.isfile(meta_filepath):
+            return None
+        version, mtime_ns, size, cache_size = np.load(meta_filepath)
+        if version != cls.BIN_VERSION or \
+                (key is not None and (mtime_ns, size) != tuple(key)):
+            return None
+        arrays = {
+            name: np.load(os.path.join(dirpath, name + '.npy'), mmap_mode='r')
+            for name in cls.BIN_ARRAYS}
+        self = cls(
+            arrays['videos'], arrays['endpoint_latencies'], int(cache_size),
+            arrays['cache_latencies'])
+        self.set_requests(
+            arrays['request_videos'], arrays['request_endpoints'],
+            arrays['request_nums'])
+        return self
+
+    # ----------------------------------------------------------
+    def save_bin(self, dirpath, key=(0, 0)):
+        """
+        Save the network in binary form.
+
+        The arrays are first written to a temporary directory, which is then
+        atomically renamed, so that concurrent processes never see a
+        partially written binary form.
+
+        Args:
+            dirpath (str): The directory where to store the binary form.
+            key (tuple[int]): The key of the source file.
+
+        Returns:
+            None.
+        """
+        tmp_dirpath = '{}.{}.tmp'.format(dirpath, os.getpid())
+        if not os.path.isdir(tmp_dirpath):
+            os.makedirs(tmp_dirpath)
+        arrays = {
+            name: getattr(self, name) for name in self.BIN_ARRAYS}
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp_dirpath, name + '.npy'), arr)
+        np.save(
+            os.path.join(tmp_dirpath, 'meta.npy'),
+            np.array((self.BIN_VERSION,) + tuple(key) + (self.cache_size,),
+                     dtype=np.int64))
+        if os.path.isdir(dirpath):
+            shutil.rmtree(dirpath, ignore_errors=True)
+        try:
+            os.rename(tmp_dirpath, dirpath)
+        except OSError:
+            # another process got there first
+            shutil.rmtree(tmp_dirpath, ignore_errors=True)
+
     # ----------------------------------------------------------
     def save(self, filepath):
         with open(filepath, 'w+') as file:
@@ -147,11 +520,352 @@ class Network(object):
             # for i in range(num_requests):
             #     requests.append([int(val) for val in file.readline().split()])
 
+    # ----------------------------------------------------------
+    @property
+    def kernel_args(self):
+        """
+        The network arrays used by the scoring kernels.
+
+        Returns:
+            result (tuple[np.ndarray]): The tuple
+                contains:
+                 - ptrs (np.ndarray): The request offsets for each video.
+                 - order (np.ndarray): The request indexes sorted by video.
+                 - request_endpoints (np.ndarray): The requesting endpoints.
+                 - request_nums (np.ndarray): The number of requests.
+                 - request_latencies (np.ndarray): The datacenter latencies.
+                 - cache_latencies (np.ndarray): The dense cache latencies.
+        """
+        if 'kernel_args' not in self._lazy:
+            ptrs, order = self.requests_by_video()
+            self._lazy['kernel_args'] = (
+                ptrs, order.astype(np.int64),
+                np.ascontiguousarray(self.request_endpoints, dtype=np.int64),
+                np.ascontiguousarray(self.request_nums, dtype=np.int64),
+                np.ascontiguousarray(self.request_latencies, dtype=float),
+                np.ascontiguousarray(self.cache_latencies, dtype=float))
+        return self._lazy['kernel_args']
+
     # ----------------------------------------------------------
     def score(self, caching):
-        return _score(
-            caching.caches, self.requests, self.cache_latencies,
-            self.endpoint_latencies)
+        return self.score_placements(*caching.placements())
+
+    # ----------------------------------------------------------
+    def score_matrix(self, matrix, serial=False):
+        """
+        Compute the score of a boolean caching matrix.
+
+        Args:
+            matrix (np.ndarray): The (num_caches, num_videos) caching matrix.
+            serial (bool): Use the serial kernel.
+                This must be used when scoring from multiple threads.
+
+        Returns:
+            score (int): The score.
+        """
+        if HAS_NUMBA:
+            gain_func = _gain_serial_nb if serial else _gain_nb
+            gain = gain_func(
+                np.ascontiguousarray(matrix, dtype=bool), *self.kernel_args)
+            return int(gain / self.total_requests * 1000)
+        else:
+            return self.score_placements(*np.nonzero(matrix))
+
+    # ----------------------------------------------------------
+    def score_placements(self, caches, videos):
+        """
+        Compute the score of the videos placed in caches.
+
+        Only the requests for the cached videos from the endpoints linked
+        to the corresponding caches are processed, either with a compiled
+        kernel (if Numba is available) or in a few vectorized operations.
+        The result is identical to `_score()`.
+
+        Args:
+            caches (np.ndarray): The cache of each placement.
+            videos (np.ndarray): The video of each placement.
+
+        Returns:
+            score (int): The score.
+        """
+        if HAS_NUMBA:
+            matrix = np.zeros((self.num_caches, self.num_videos), dtype=bool)
+            matrix[caches, videos] = True
+            return self.score_matrix(matrix)
+        else:
+            latencies = self.request_latencies
+            best_latencies = self.best_latencies(caches, videos)
+            score = np.dot(latencies - best_latencies, self.request_nums)
+            return int(score / self.total_requests * 1000)
+
+    # ----------------------------------------------------------
+    def best_latencies(self, caches, videos):
+        """
+        Compute the best latency of each request for the given placements.
+
+        Args:
+            caches (np.ndarray): The cache of each placement.
+            videos (np.ndarray): The video of each placement.
+
+        Returns:
+            best_latencies (np.ndarray): The best latency of each request.
+        """
+        best_latencies = np.array(self.request_latencies, dtype=float)
+        requests, placements = self._placement_requests(videos)
+        cache_latencies = np.asarray(self.cache_latencies)[
+            self.request_endpoints[requests], np.asarray(caches)[placements]]
+        mask = (cache_latencies > 0) & \
+            (cache_latencies < best_latencies[requests])
+        np.minimum.at(
+            best_latencies, requests[mask], cache_latencies[mask])
+        return best_latencies
+
+    # ----------------------------------------------------------
+    def score_many(self, cachings, max_bytes=2 ** 28):
+        """
+        Compute the scores of many cachings at once.
+
+        The cachings are processed in chunks, each with a compiled kernel
+        running in parallel over the cachings (if Numba is available) or in
+        a few vectorized operations, so that the temporary arrays
+        approximately stay within the memory budget.
+
+        Args:
+            cachings (np.ndarray|Iterable[Caching]): The cachings.
+                If np.ndarray of bool, the stacked caching matrices with
+                shape (num_cachings, num_caches, num_videos).
+                If np.ndarray of uint8, the same matrices packed along
+                the last axis (as obtained with `np.packbits(.., axis=-1)`).
+            max_bytes (int): The approximate memory budget in bytes.
+
+        Returns:
+            scores (np.ndarray): The score of each caching.
+        """
+        if isinstance(cachings, np.ndarray):
+            num_cachings = len(cachings)
+            if cachings.dtype == np.uint8:
+                def get_placements(i, j):
+                    return _packed_nonzero(cachings[i:j])
+            else:
+                def get_placements(i, j):
+                    return np.nonzero(cachings[i:j])
+        else:
+            cachings = list(cachings)
+            num_cachings = len(cachings)
+
+            def get_placements(i, j):
+                placements = [
+                    caching.placements() for caching in cachings[i:j]]
+                indexes = np.repeat(
+                    np.arange(j - i), [len(caches) for caches, _ in placements])
+                caches = np.concatenate([caches for caches, _ in placements])
+                videos = np.concatenate([videos for _, videos in placements])
+                return indexes, caches, videos
+
+        member_bytes = \
+            8 * self.num_requests + self.num_caches * self.num_videos
+        chunk_size = max(1, max_bytes // member_bytes)
+        latencies = np.asarray(self.request_latencies, dtype=float)
+        cache_latencies = np.asarray(self.cache_latencies)
+        scores = np.zeros(num_cachings, dtype=np.int64)
+        for i in range(0, num_cachings, chunk_size):
+            j = min(i + chunk_size, num_cachings)
+            if HAS_NUMBA and isinstance(cachings, np.ndarray) and \
+                    cachings.dtype == bool:
+                gains = _gain_many_nb(
+                    np.ascontiguousarray(cachings[i:j]), *self.kernel_args)
+            elif HAS_NUMBA:
+                matrices = np.zeros(
+                    (j - i, self.num_caches, self.num_videos), dtype=bool)
+                matrices[get_placements(i, j)] = True
+                gains = _gain_many_nb(matrices, *self.kernel_args)
+            else:
+                indexes, caches, videos = get_placements(i, j)
+                requests, placements = self._placement_requests(videos)
+                indexes = indexes[placements] * self.num_requests + requests
+                best_latencies = np.tile(latencies, j - i)
+                pair_latencies = cache_latencies[
+                    self.request_endpoints[requests], caches[placements]]
+                mask = (pair_latencies > 0) & \
+                    (pair_latencies < best_latencies[indexes])
+                np.minimum.at(
+                    best_latencies, indexes[mask], pair_latencies[mask])
+                best_latencies = best_latencies.reshape(j - i, -1)
+                gains = np.dot(latencies - best_latencies, self.request_nums)
+            scores[i:j] = [
+                int(gain / self.total_requests * 1000) for gain in gains]
+        return scores
+
+    # ----------------------------------------------------------
+    def _placement_requests(self, videos):
+        """
+        Expand the placements to the requests for the placed videos.
+
+        Args:
+            videos (np.ndarray): The video of each placement.
+
+        Returns:
+            result (tuple[np.ndarray]): The tuple
+                contains:
+                 - requests (np.ndarray): The request indexes.
+                 - placements (np.ndarray): The corresponding placements.
+        """
+        ptrs, order = self.requests_by_video()
+        videos = np.asarray(videos, dtype=np.int64)
+        begins = ptrs[videos]
+        counts = ptrs[videos + 1] - begins
+        ends = np.cumsum(counts)
+        indexes = np.arange(ends[-1] if len(ends) else 0) + np.repeat(
+            begins - (ends - counts), counts)
+        return order[indexes], np.repeat(np.arange(len(videos)), counts)
+
+    # ----------------------------------------------------------
+    def reduce(self, verbose=True):
+        """
+        Reduce the network without changing which caching is optimal.
+
+        The reduction:
+         - discards the cache links that are not faster than the datacenter;
+         - drops the videos that do not fit in a cache;
+         - drops the requests that no caching can improve, i.e. those for
+           dropped videos or from endpoints without (useful) cache links;
+         - merges the requests for the same (video, endpoint) pair;
+         - drops the videos that are no longer requested.
+
+        The videos are renumbered, and `video_ids` of the reduced network
+        maps the new IDs to the original ones (see `expand_caching()` and
+        `reduce_caching()`).
+        The score normalization (`total_requests`) is preserved, so that the
+        reduced network gives the same score as the original one.
+
+        Args:
+            verbose (bool): Print the reduction statistics.
+
+        Returns:
+            network (Network): The reduced network.
+                The reduction statistics are in `reduction_stats`.
+        """
+        # :: discard useless links
+        cache_latencies = np.array(self.cache_latencies)
+        cache_latencies[
+            cache_latencies >= self.endpoint_latencies[:, None]] = 0
+        num_links = np.diff(_links_from_latencies(cache_latencies)[0])
+
+        # :: drop useless requests
+        mask = (self.videos[self.request_videos] <= self.cache_size) & \
+            (num_links[self.request_endpoints] > 0)
+        request_videos = self.request_videos[mask].astype(np.int64)
+        request_endpoints = self.request_endpoints[mask].astype(np.int64)
+        request_nums = self.request_nums[mask].astype(np.int64)
+
+        # :: merge duplicate requests
+        request_videos, request_endpoints, request_nums = _merge_requests(
+            request_videos, request_endpoints, request_nums,
+            self.num_endpoints)
+
+        # :: drop (and renumber) unrequested videos
+        video_ids, request_videos = np.unique(
+            request_videos, return_inverse=True)
+
+        network = self.__class__(
+            self.videos[video_ids], self.endpoint_latencies, self.cache_size,
+            cache_latencies,
+            np.stack((request_videos.ravel(), request_endpoints,
+                      request_nums), axis=-1))
+        network._total_requests = self.total_requests
+        network.video_ids = \
+            video_ids if self.video_ids is None else self.video_ids[video_ids]
+        network.reduction_stats = {
+            name: (getattr(self, name), getattr(network, name))
+            for name in ('num_videos', 'num_links', 'num_requests')}
+        if verbose:
+            print('I: Reduced {}'.format(', '.join(
+                '{}: {} -> {} ({:.1%})'.format(
+                    name, old, new, new / old if old else 1.0)
+                for name, (old, new) in network.reduction_stats.items())))
+        return network
+
+    # ----------------------------------------------------------
+    def merge_endpoints(self, verbose=True):
+        """
+        Merge the endpoints with identical latency profiles.
+
+        Endpoints with the same datacenter latency and the same cache
+        latencies are interchangeable for scoring, so their requests for
+        the same video can be added together.
+        The videos (and hence the cachings) are not affected.
+
+        Args:
+            verbose (bool): Print the reduction ratio.
+
+        Returns:
+            network (Network): The network with merged endpoints.
+                The reduction statistics are in `reduction_stats`.
+        """
+        profiles = np.concatenate(
+            (np.asarray(self.endpoint_latencies)[:, None],
+             self.cache_latencies), axis=1)
+        profiles, endpoint_ids = np.unique(
+            profiles, axis=0, return_inverse=True)
+        endpoint_ids = endpoint_ids.ravel()
+        num_endpoints = len(profiles)
+        request_videos, request_endpoints, request_nums = _merge_requests(
+            self.request_videos, endpoint_ids[self.request_endpoints],
+            self.request_nums, num_endpoints)
+        network = self.__class__(
+            self.videos, profiles[:, 0], self.cache_size,
+            profiles[:, 1:],
+            np.stack((request_videos, request_endpoints, request_nums),
+                     axis=-1))
+        network._total_requests = self.total_requests
+        network.video_ids = self.video_ids
+        network.reduction_stats = {
+            name: (getattr(self, name), getattr(network, name))
+            for name in ('num_endpoints', 'num_links', 'num_requests')}
+        if verbose:
+            print('I: Merged {}'.format(', '.join(
+                '{}: {} -> {} ({:.1%})'.format(
+                    name, old, new, new / old if old else 1.0)
+                for name, (old, new) in network.reduction_stats.items())))
+        return network
+
+    # ----------------------------------------------------------
+    def expand_caching(self, caching):
+        """
+        Map a caching of a reduced network back to the original videos.
+
+        Args:
+            caching (Caching): The caching using the IDs of this network.
+
+        Returns:
+            caching (Caching): The caching using the original video IDs.
+        """
+        if self.video_ids is None:
+            return caching
+        video_ids = self.video_ids.tolist()
+        return Caching([
+            set(video_ids[video] for video in videos)
+            for videos in caching.caches])
+
+    # ----------------------------------------------------------
+    def reduce_caching(self, caching):
+        """
+        Map a caching of the original network to the videos of this network.
+
+        The videos that were dropped by the reduction are discarded.
+
+        Args:
+            caching (Caching): The caching using the original video IDs.
+
+        Returns:
+            caching (Caching): The caching using the IDs of this network.
+        """
+        if self.video_ids is None:
+            return caching
+        new_ids = dict(zip(self.video_ids.tolist(), range(self.num_videos)))
+        return Caching([
+            set(new_ids[video] for video in videos if video in new_ids)
+            for videos in caching.caches])
 
 
 # ======================================================================
@@ -240,9 +954,25 @@ class Caching(object):
 
     # ----------------------------------------------------------
     def score(self, network):
-        return _score(
-            self.caches, network.requests, network.cache_latencies,
-            network.endpoint_latencies)
+        return network.score(self)
+
+    # ----------------------------------------------------------
+    def placements(self):
+        """
+        Get the cached videos as (cache, video) placements.
+
+        Returns:
+            result (tuple[np.ndarray]): The tuple
+                contains:
+                 - caches (np.ndarray): The cache of each placement.
+                 - videos (np.ndarray): The video of each placement.
+        """
+        lengths = [len(videos) for videos in self.caches]
+        caches = np.repeat(np.arange(self.num_caches), lengths)
+        videos = np.fromiter(
+            (video for videos in self.caches for video in videos),
+            dtype=np.int64, count=sum(lengths))
+        return caches, videos
 
     # ----------------------------------------------------------
     def clear(self):
@@ -265,44 +995,874 @@ class Caching(object):
 
 
 # ======================================================================
-@jit
-def _score(caches, requests, cache_latencies, endpoint_latencies):
+class CachingBits(Caching):
+    def __init__(
+            self,
+            caches=None,
+            num_videos=None):
+        """
+        Caching of videos stored as a packed bit matrix.
+
+        The bit for video `j` in cache `i` is set if the video is cached.
+        The public API is the same as `Caching`, but membership tests,
+        copying and crossover are cheap array operations.
+
+        Args:
+            caches (int|list[set]|np.ndarray): The videos in each cache.
+                If int, the number of (empty) caching servers.
+                If list[set], the videos contained in each caching server.
+                If np.ndarray of bool, the (num_caches, num_videos) matrix.
+                If np.ndarray of uint8, the packed bit matrix
+                (as obtained from `np.packbits(matrix, axis=1)`).
+            num_videos (int|None): The number of videos.
+                If None, this is inferred from `caches`.
+        """
+        self.num_videos = num_videos
+        if isinstance(caches, np.ndarray):
+            if caches.dtype == np.uint8:
+                if num_videos is None:
+                    raise AttributeError(
+                        '`num_videos` must be supplied for packed bits!')
+                self.bits = caches
+            else:
+                self.matrix = caches
+        else:
+            try:
+                iter(caches)
+            except TypeError:
+                if caches > 0 and num_videos is not None:
+                    self.bits = np.zeros(
+                        (caches, (num_videos + 7) // 8), dtype=np.uint8)
+                else:
+                    raise AttributeError(
+                        'Either `caches` or `num_caches` and `num_videos` '
+                        'must be supplied!')
+            else:
+                self.caches = caches
+
+    # ----------------------------------------------------------
+    @property
+    def num_caches(self):
+        return self.bits.shape[0]
+
+    # ----------------------------------------------------------
+    @property
+    def caches(self):
+        return [
+            set(np.flatnonzero(row).tolist()) for row in self.matrix]
+
+    # ----------------------------------------------------------
+    @caches.setter
+    def caches(self, value):
+        caches = [list(videos) for videos in value]
+        lengths = [len(videos) for videos in caches]
+        videos = np.array(
+            [video for videos in caches for video in videos], dtype=np.int64)
+        if self.num_videos is None:
+            self.num_videos = int(videos.max()) + 1 if videos.size else 0
+        matrix = np.zeros((len(caches), self.num_videos), dtype=bool)
+        matrix[np.repeat(np.arange(len(caches)), lengths), videos] = True
+        self.matrix = matrix
+
+    # ----------------------------------------------------------
+    @property
+    def matrix(self):
+        """
+        The (num_caches, num_videos) boolean caching matrix.
+        """
+        return np.unpackbits(
+            self.bits, axis=1, count=self.num_videos).astype(bool)
+
+    # ----------------------------------------------------------
+    @matrix.setter
+    def matrix(self, value):
+        value = np.asarray(value, dtype=bool)
+        self.num_videos = value.shape[1]
+        self.bits = np.packbits(value, axis=1)
+
+    # ----------------------------------------------------------
+    def __repr__(self):
+        return str(dict(num_videos=self.num_videos, caches=self.caches))
+
+    # ----------------------------------------------------------
+    def placements(self):
+        return _packed_nonzero(self.bits)
+
+    # ----------------------------------------------------------
+    def __contains__(self, item):
+        cache, video = item
+        return bool((self.bits[cache, video >> 3] >> (7 - (video & 7))) & 1)
+
+    # ----------------------------------------------------------
+    def add(self, cache, video):
+        self.bits[cache, video >> 3] |= np.uint8(1 << (7 - (video & 7)))
+
+    # ----------------------------------------------------------
+    def discard(self, cache, video):
+        self.bits[cache, video >> 3] &= \
+            np.uint8(0xff ^ (1 << (7 - (video & 7))))
+
+    # ----------------------------------------------------------
+    def copy(self):
+        return self.__class__(self.bits.copy(), self.num_videos)
+
+    # ----------------------------------------------------------
+    def crossover(self, other, caches):
+        """
+        Generate a new caching with some caches taken from another one.
+
+        Args:
+            other (CachingBits): The other caching.
+            caches (Iterable[int]|np.ndarray): The caches to take from other.
+                Either the cache indexes or a boolean mask.
+
+        Returns:
+            caching (CachingBits): The new caching.
+        """
+        bits = self.bits.copy()
+        bits[caches] = other.bits[caches]
+        return self.__class__(bits, self.num_videos)
+
+    # ----------------------------------------------------------
+    @classmethod
+    def from_caching(cls, caching, num_videos=None):
+        """
+        Generate the bit caching from a set-based caching.
+
+        Args:
+            caching (Caching): The set-based caching.
+            num_videos (int|None): The number of videos.
+                If None, this is inferred from `caching`.
+
+        Returns:
+            caching (CachingBits): The bit caching.
+        """
+        return cls(caching.caches, num_videos)
+
+    # ----------------------------------------------------------
+    def to_caching(self):
+        """
+        Generate the set-based caching.
+
+        Returns:
+            caching (Caching): The set-based caching.
+        """
+        return Caching(self.caches)
+
+    # ----------------------------------------------------------
+    @classmethod
+    def load(cls, filepath, num_videos=None):
+        return cls.from_caching(Caching.load(filepath), num_videos)
+
+    # ----------------------------------------------------------
+    def validate(self, videos, cache_size):
+        return bool(np.all(self.matrix.dot(videos) <= cache_size))
+
+    # ----------------------------------------------------------
+    def clear(self):
+        self.bits[...] = 0
+
+    # ----------------------------------------------------------
+    def fill(self, network):
+        if self.num_videos != network.num_videos:
+            self.num_videos = network.num_videos
+            self.bits = np.zeros(
+                (self.num_caches, (self.num_videos + 7) // 8), dtype=np.uint8)
+        # same random filling as `Caching.fill()`: all caches are equal
+        min_video_size = np.min(network.videos)
+        new_videos = list(range(network.num_videos))
+        random.shuffle(new_videos)
+        videos = network.videos.tolist()
+        row = np.zeros(network.num_videos, dtype=bool)
+        avail_cache = network.cache_size
+        for new_video in new_videos:
+            video_size = videos[new_video]
+            if video_size <= avail_cache:
+                row[new_video] = True
+                avail_cache -= video_size
+            if min_video_size > avail_cache:
+                break
+        self.bits |= np.packbits(row)
+
+
+# ======================================================================
+class CachingEvaluator(object):
+    def __init__(
+            self,
+            network,
+            caching=None):
+        """
+        Incremental evaluation of single-video caching moves.
+
+        The evaluator keeps the current best latency of each request, so
+        that the score change of adding or removing one video from one cache
+        only depends on the requests for that video.
+        The moves are evaluated with compiled kernels if Numba is available.
+
+        The score changes (deltas) and `gain` are expressed as the total
+        latency saved (before normalization), while `score` is normalized
+        as in `Network.score()`.
+
+        Args:
+            network (Network): The network.
+            caching (Caching|None): The initial caching.
+                If None, all caches are initially empty.
+        """
+        self.network = network
+        self._videos = np.asarray(network.videos)
+        self._nums = network.request_nums
+        self._request_latencies = network.request_latencies
+        self._kernel_args = network.kernel_args
+        self.matrix = np.zeros(
+            (network.num_caches, network.num_videos), dtype=bool)
+        self.used = np.zeros(network.num_caches, dtype=np.int64)
+        self.best_latencies = np.array(self._request_latencies, dtype=float)
+        self.gain = 0.0
+        if caching is not None:
+            self.reset(*caching.placements())
+
+    # ----------------------------------------------------------
+    def reset(self, caches, videos):
+        """
+        Reset the state to the given placements.
+
+        Args:
+            caches (np.ndarray): The cache of each placement.
+            videos (np.ndarray): The video of each placement.
+
+        Returns:
+            None.
+        """
+        self.matrix[...] = False
+        self.matrix[caches, videos] = True
+        self.used = np.bincount(
+            caches, weights=self._videos[videos],
+            minlength=self.network.num_caches).astype(np.int64)
+        self.best_latencies = self.network.best_latencies(caches, videos)
+        self.gain = float(np.dot(
+            self._request_latencies - self.best_latencies, self._nums))
+
+    # ----------------------------------------------------------
+    @property
+    def score(self):
+        return int(self.gain / self.network.total_requests * 1000)
+
+    # ----------------------------------------------------------
+    def fits(self, cache, video):
+        """
+        Check if a video fits in the available space of a cache.
+        """
+        return \
+            self.used[cache] + self._videos[video] <= self.network.cache_size
+
+    # ----------------------------------------------------------
+    def delta_add(self, cache, video):
+        """
+        Compute the score change of adding a video to a cache.
+
+        The cache capacity is not checked (see `fits()`).
+
+        Args:
+            cache (int): The cache ID.
+            video (int): The video ID.
+
+        Returns:
+            delta (float): The change in the total latency saved.
+        """
+        if self.matrix[cache, video]:
+            return 0.0
+        return _delta_add(
+            cache, video, self.matrix, self.best_latencies,
+            *self._kernel_args, update=False)
+
+    # ----------------------------------------------------------
+    def delta_remove(self, cache, video):
+        """
+        Compute the score change of removing a video from a cache.
+
+        Args:
+            cache (int): The cache ID.
+            video (int): The video ID.
+
+        Returns:
+            delta (float): The change in the total latency saved.
+        """
+        if not self.matrix[cache, video]:
+            return 0.0
+        return _delta_remove(
+            cache, video, self.matrix, self.best_latencies,
+            *self._kernel_args, update=False)
+
+    # ----------------------------------------------------------
+    def apply(self, cache, video, cached=True):
+        """
+        Add a video to or remove a video from a cache.
+
+        Args:
+            cache (int): The cache ID.
+            video (int): The video ID.
+            cached (bool): Add the video if True, remove it otherwise.
+
+        Returns:
+            delta (float): The change in the total latency saved.
+        """
+        if self.matrix[cache, video] == cached:
+            return 0.0
+        if cached:
+            delta = _delta_add(
+                cache, video, self.matrix, self.best_latencies,
+                *self._kernel_args, update=True)
+            self.used[cache] += self._videos[video]
+        else:
+            delta = _delta_remove(
+                cache, video, self.matrix, self.best_latencies,
+                *self._kernel_args, update=True)
+            self.used[cache] -= self._videos[video]
+        self.matrix[cache, video] = cached
+        self.gain += delta
+        return delta
+
+    # ----------------------------------------------------------
+    def to_caching(self):
+        """
+        Generate the caching corresponding to the current state.
+
+        Returns:
+            caching (Caching): The set-based caching.
+        """
+        return Caching(
+            [set(np.flatnonzero(row).tolist()) for row in self.matrix])
+
+
+# ======================================================================
+def _score(
+        caches, request_videos, request_endpoints, request_nums,
+        link_ptrs, link_caches, link_latencies, endpoint_latencies, num_tot):
+    requests = zip(
+        request_videos.tolist(), request_endpoints.tolist(),
+        request_nums.tolist())
+    link_ptrs = link_ptrs.tolist()
+    link_caches = link_caches.tolist()
+    link_latencies = link_latencies.tolist()
+    endpoint_latencies = endpoint_latencies.tolist()
     score = 0
-    num_tot = 0
     for video, endpoint, num in requests:
-        num_tot += num
         latency = max_latency = endpoint_latencies[endpoint]
-        for cache, videos in enumerate(caches):
-            if video in videos:
-                cache_latency = cache_latencies[endpoint, cache]
-                if cache_latency and cache_latency < latency:
-                    latency = cache_latencies[endpoint, cache]
+        begin, end = link_ptrs[endpoint], link_ptrs[endpoint + 1]
+        for cache, cache_latency in zip(
+                link_caches[begin:end], link_latencies[begin:end]):
+            if video in caches[cache] and cache_latency < latency:
+                latency = cache_latency
         score += (max_latency - latency) * num
     score = int(score / num_tot * 1000)
     return score
 
 
 # ======================================================================
-def _score_par(caches, requests, cache_latencies, endpoint_latencies):
-    pool = multiprocessing.Pool(multiprocessing.cpu_count())
-    scores, nums = [], []
-    results = [
-        pool.apply_async(
-            _score_request,
-            (caches, video, endpoint, num, cache_latencies, endpoint_latencies))
-        for video, endpoint, num in requests]
-    # todo
-    scores, nums = zip(*results)
+@njit(cache=True, nogil=True)
+def _video_gain_nb(
+        matrix, video, ptrs, order, request_endpoints, request_nums,
+        request_latencies, cache_latencies):
+    """
+    Compute the latency saved for the requests of a video (compiled).
+    """
+    num_caches = matrix.shape[0]
+    holders = np.empty(num_caches, dtype=np.int64)
+    num_holders = 0
+    for cache in range(num_caches):
+        if matrix[cache, video]:
+            holders[num_holders] = cache
+            num_holders += 1
+    gain = 0.0
+    if num_holders > 0:
+        for i in range(ptrs[video], ptrs[video + 1]):
+            request = order[i]
+            endpoint = request_endpoints[request]
+            best_latency = request_latencies[request]
+            for j in range(num_holders):
+                cache_latency = cache_latencies[endpoint, holders[j]]
+                if 0 < cache_latency < best_latency:
+                    best_latency = cache_latency
+            gain += \
+                (request_latencies[request] - best_latency) * \
+                request_nums[request]
+    return gain
+
+
+# ======================================================================
+@njit(cache=True, nogil=True, parallel=True)
+def _gain_nb(
+        matrix, ptrs, order, request_endpoints, request_nums,
+        request_latencies, cache_latencies):
+    """
+    Compute the latency saved by a caching matrix (compiled).
+
+    Args:
+        matrix (np.ndarray): The (num_caches, num_videos) caching matrix.
+        ptrs (np.ndarray): The request offsets for each video.
+        order (np.ndarray): The request indexes sorted by video.
+        request_endpoints (np.ndarray): The requesting endpoints.
+        request_nums (np.ndarray): The number of requests.
+        request_latencies (np.ndarray): The datacenter latencies.
+        cache_latencies (np.ndarray): The dense cache latencies.
+
+    Returns:
+        gain (float): The total latency saved.
+    """
+    gain = 0.0
+    for video in prange(matrix.shape[1]):
+        gain += _video_gain_nb(
+            matrix, video, ptrs, order, request_endpoints, request_nums,
+            request_latencies, cache_latencies)
+    return gain
+
+
+# ======================================================================
+@njit(cache=True, nogil=True)
+def _gain_serial_nb(
+        matrix, ptrs, order, request_endpoints, request_nums,
+        request_latencies, cache_latencies):
+    """
+    Compute the latency saved by a caching matrix (compiled, serial).
+
+    This is the serial version of `_gain_nb()`, which can be called
+    concurrently from a thread pool (the parallel kernels cannot).
+    """
+    gain = 0.0
+    for video in range(matrix.shape[1]):
+        gain += _video_gain_nb(
+            matrix, video, ptrs, order, request_endpoints, request_nums,
+            request_latencies, cache_latencies)
+    return gain
+
+
+# ======================================================================
+@njit(cache=True, nogil=True, parallel=True)
+def _gain_many_nb(
+        matrices, ptrs, order, request_endpoints, request_nums,
+        request_latencies, cache_latencies):
+    """
+    Compute the latency saved by many caching matrices (compiled).
+
+    Args:
+        matrices (np.ndarray): The (num_cachings, num_caches, num_videos)
+            stacked caching matrices.
+        ptrs (np.ndarray): The request offsets for each video.
+        order (np.ndarray): The request indexes sorted by video.
+        request_endpoints (np.ndarray): The requesting endpoints.
+        request_nums (np.ndarray): The number of requests.
+        request_latencies (np.ndarray): The datacenter latencies.
+        cache_latencies (np.ndarray): The dense cache latencies.
+
+    Returns:
+        gains (np.ndarray): The total latency saved by each caching.
+    """
+    gains = np.zeros(matrices.shape[0])
+    for i in prange(matrices.shape[0]):
+        gain = 0.0
+        for video in range(matrices.shape[2]):
+            gain += _video_gain_nb(
+                matrices[i], video, ptrs, order, request_endpoints,
+                request_nums, request_latencies, cache_latencies)
+        gains[i] = gain
+    return gains
+
+
+# ======================================================================
+@njit(cache=True, nogil=True)
+def _delta_add_nb(
+        cache, video, matrix, best_latencies, ptrs, order, request_endpoints,
+        request_nums, request_latencies, cache_latencies, update):
+    """
+    Compute (and optionally apply) the gain of adding a video to a cache.
+
+    Args:
+        cache (int): The cache ID.
+        video (int): The video ID.
+        matrix (np.ndarray): The (num_caches, num_videos) caching matrix.
+        best_latencies (np.ndarray): The best latency of each request.
+            This is updated in-place if `update` is True.
+        ptrs (np.ndarray): The request offsets for each video.
+        order (np.ndarray): The request indexes sorted by video.
+        request_endpoints (np.ndarray): The requesting endpoints.
+        request_nums (np.ndarray): The number of requests.
+        request_latencies (np.ndarray): The datacenter latencies.
+        cache_latencies (np.ndarray): The dense cache latencies.
+        update (bool): Update the best latencies.
+
+    Returns:
+        delta (float): The change in the total latency saved.
+    """
+    delta = 0.0
+    for i in range(ptrs[video], ptrs[video + 1]):
+        request = order[i]
+        cache_latency = cache_latencies[request_endpoints[request], cache]
+        if 0 < cache_latency < best_latencies[request]:
+            delta += \
+                (best_latencies[request] - cache_latency) * \
+                request_nums[request]
+            if update:
+                best_latencies[request] = cache_latency
+    return delta
+
+
+# ======================================================================
+@njit(cache=True, nogil=True)
+def _delta_remove_nb(
+        cache, video, matrix, best_latencies, ptrs, order, request_endpoints,
+        request_nums, request_latencies, cache_latencies, update):
+    """
+    Compute (and optionally apply) the gain of removing a video from a cache.
+
+    The arguments are the same as `_delta_add_nb()`.
+    The caching matrix is not modified.
+    """
+    delta = 0.0
+    for i in range(ptrs[video], ptrs[video + 1]):
+        request = order[i]
+        endpoint = request_endpoints[request]
+        cache_latency = cache_latencies[endpoint, cache]
+        if 0 < cache_latency == best_latencies[request]:
+            best_latency = request_latencies[request]
+            for other in range(matrix.shape[0]):
+                if other != cache and matrix[other, video]:
+                    other_latency = cache_latencies[endpoint, other]
+                    if 0 < other_latency < best_latency:
+                        best_latency = other_latency
+            delta -= \
+                (best_latency - best_latencies[request]) * \
+                request_nums[request]
+            if update:
+                best_latencies[request] = best_latency
+    return delta
+
+
+# ======================================================================
+def _linked_requests_np(
+        cache, video, ptrs, order, request_endpoints, cache_latencies):
+    """
+    Get the requests for a video from the endpoints linked to a cache.
+
+    Returns:
+        result (tuple[np.ndarray]): The tuple
+            contains:
+             - requests (np.ndarray): The request indexes.
+             - latencies (np.ndarray): The latencies through the cache.
+    """
+    requests = order[ptrs[video]:ptrs[video + 1]]
+    latencies = cache_latencies[request_endpoints[requests], cache]
+    mask = latencies > 0
+    return requests[mask], latencies[mask]
+
+
+# ======================================================================
+def _delta_add_np(
+        cache, video, matrix, best_latencies, ptrs, order, request_endpoints,
+        request_nums, request_latencies, cache_latencies, update):
+    """
+    Compute (and optionally apply) the gain of adding a video to a cache.
+
+    This is the NumPy equivalent of `_delta_add_nb()`.
+    """
+    requests, latencies = _linked_requests_np(
+        cache, video, ptrs, order, request_endpoints, cache_latencies)
+    latencies = np.minimum(best_latencies[requests], latencies)
+    delta = -float(np.dot(
+        latencies - best_latencies[requests], request_nums[requests]))
+    if update:
+        best_latencies[requests] = latencies
+    return delta
+
+
+# ======================================================================
+def _delta_remove_np(
+        cache, video, matrix, best_latencies, ptrs, order, request_endpoints,
+        request_nums, request_latencies, cache_latencies, update):
+    """
+    Compute (and optionally apply) the gain of removing a video from a cache.
+
+    This is the NumPy equivalent of `_delta_remove_nb()`.
+    """
+    requests, latencies = _linked_requests_np(
+        cache, video, ptrs, order, request_endpoints, cache_latencies)
+    requests = requests[latencies == best_latencies[requests]]
+    holders = np.flatnonzero(matrix[:, video])
+    holders = holders[holders != cache]
+    latencies = request_latencies[requests].astype(float)
+    if len(holders) and len(requests):
+        other_latencies = cache_latencies[
+            np.ix_(request_endpoints[requests], holders)]
+        other_latencies[other_latencies == 0] = np.inf
+        latencies = np.minimum(latencies, other_latencies.min(axis=1))
+    delta = -float(np.dot(
+        latencies - best_latencies[requests], request_nums[requests]))
+    if update:
+        best_latencies[requests] = latencies
+    return delta
+
+
+# ======================================================================
+@njit(cache=True, nogil=True, parallel=True)
+def _random_fill_nb(matrix, caches, videos, cache_size):
+    """
+    Fill caches with randomly chosen videos until full (compiled).
+
+    Args:
+        matrix (np.ndarray): The (num_caches, num_videos) caching matrix.
+            The rows of the filled caches are overwritten in-place.
+        caches (np.ndarray): The caches to fill.
+        videos (np.ndarray): The video sizes.
+        cache_size (int): The capacity of each caching server in MB.
+
+    Returns:
+        None.
+    """
+    min_video_size = videos.min()
+    for i in prange(len(caches)):
+        cache = caches[i]
+        matrix[cache, :] = False
+        avail_cache = cache_size
+        for new_video in np.random.permutation(len(videos)):
+            if videos[new_video] <= avail_cache:
+                matrix[cache, new_video] = True
+                avail_cache -= videos[new_video]
+            if min_video_size > avail_cache:
+                break
+
+
+# ======================================================================
+@njit(cache=True, nogil=True)
+def _random_fill_serial_nb(matrix, caches, videos, cache_size):
+    """
+    Fill caches with randomly chosen videos until full (compiled, serial).
+
+    This is the serial version of `_random_fill_nb()`, which can be called
+    concurrently from a thread pool (the parallel kernels cannot).
+    """
+    min_video_size = videos.min()
+    for i in range(len(caches)):
+        cache = caches[i]
+        matrix[cache, :] = False
+        avail_cache = cache_size
+        for new_video in np.random.permutation(len(videos)):
+            if videos[new_video] <= avail_cache:
+                matrix[cache, new_video] = True
+                avail_cache -= videos[new_video]
+            if min_video_size > avail_cache:
+                break
+
+
+# ======================================================================
+def _random_fill_np(matrix, caches, videos, cache_size):
+    """
+    Fill caches with randomly chosen videos until full.
+
+    This is the NumPy equivalent of `_random_fill_nb()`.
+    """
+    min_video_size = videos.min()
+    sizes = videos.tolist()
+    for cache in caches:
+        matrix[cache, :] = False
+        avail_cache = cache_size
+        for new_video in np.random.permutation(len(videos)).tolist():
+            if sizes[new_video] <= avail_cache:
+                matrix[cache, new_video] = True
+                avail_cache -= sizes[new_video]
+            if min_video_size > avail_cache:
+                break
+
+
+# ======================================================================
+@njit(cache=True, nogil=True)
+def _crossover_nb(matrix, other, caches):
+    """
+    Copy the content of some caches from another caching (compiled).
+
+    Args:
+        matrix (np.ndarray): The (num_caches, num_videos) caching matrix.
+            The rows of the crossed caches are overwritten in-place.
+        other (np.ndarray): The (num_caches, num_videos) other matrix.
+        caches (np.ndarray): The caches to take from other.
+
+    Returns:
+        None.
+    """
+    for i in range(len(caches)):
+        matrix[caches[i], :] = other[caches[i], :]
+
+
+# ======================================================================
+def _crossover_np(matrix, other, caches):
+    """
+    Copy the content of some caches from another caching.
+
+    This is the NumPy equivalent of `_crossover_nb()`.
+    """
+    matrix[caches] = other[caches]
+
+
+# ======================================================================
+if HAS_NUMBA:
+    _delta_add, _delta_remove, _random_fill, _crossover = \
+        _delta_add_nb, _delta_remove_nb, _random_fill_nb, _crossover_nb
+    _random_fill_serial = _random_fill_serial_nb
+else:
+    _delta_add, _delta_remove, _random_fill, _crossover = \
+        _delta_add_np, _delta_remove_np, _random_fill_np, _crossover_np
+    _random_fill_serial = _random_fill_np
+
+
+# ======================================================================
+# shared state of the `ParallelScorer` worker processes
+_SCORER = {}
+
+
+# ======================================================================
+def _scorer_init(specs, cache_size, total_requests):
+    """
+    Initialize a `ParallelScorer` worker process.
+
+    Args:
+        specs (dict): The shared arrays as name: (shm_name, shape, dtype).
+        cache_size (int): The capacity of each caching server in MB.
+        total_requests (int): The total number of requests.
+
+    Returns:
+        None.
+    """
+    _SCORER.clear()
+    _SCORER['shms'] = [
+        shared_memory.SharedMemory(shm_name)
+        for shm_name, shape, dtype in specs.values()]
+    _SCORER['arrays'] = {
+        name: np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        for (name, (shm_name, shape, dtype)), shm
+        in zip(specs.items(), _SCORER['shms'])}
+    _SCORER['cache_size'] = cache_size
+    _SCORER['total_requests'] = total_requests
+    _SCORER['networks'] = {}
+
+
+# ======================================================================
+def _score_par(bounds):
+    """
+    Compute the latency saved for a contiguous chunk of the requests.
+
+    This runs in the `ParallelScorer` worker processes, on the shared
+    network and caching arrays.
+
+    Args:
+        bounds (tuple[int]): The first and last (excluded) request indexes.
+
+    Returns:
+        gain (float): The latency saved for the requests of the chunk.
+    """
+    arrays = _SCORER['arrays']
+    if bounds not in _SCORER['networks']:
+        begin, end = bounds
+        network = Network(
+            arrays['videos'], arrays['endpoint_latencies'],
+            _SCORER['cache_size'], arrays['cache_latencies'])
+        network.set_requests(
+            arrays['request_videos'][begin:end],
+            arrays['request_endpoints'][begin:end],
+            arrays['request_nums'][begin:end])
+        _SCORER['networks'][bounds] = network
+    network = _SCORER['networks'][bounds]
+    best_latencies = network.best_latencies(*np.nonzero(arrays['matrix']))
+    return float(np.dot(
+        network.request_latencies - best_latencies, network.request_nums))
 
 
 # ======================================================================
-def _score_request(
-        caches, video, endpoint, num, cache_latencies, endpoint_latencies):
-    latency = max_latency = endpoint_latencies[endpoint]
-    for cache, videos in enumerate(caches):
-        if video in videos:
-            cache_latency = cache_latencies[endpoint, cache]
-            if cache_latency and cache_latency < latency:
-                latency = cache_latencies[endpoint, cache]
-    score = (max_latency - latency) * num
-    return score, num
+class ParallelScorer(object):
+    def __init__(
+            self,
+            network,
+            num_workers=None):
+        """
+        Parallel scoring of cachings on a persistent pool of processes.
+
+        The network arrays and the caching matrix are placed in shared
+        memory, and each worker scores a contiguous chunk of the requests,
+        so that nothing but the chunk bounds is pickled for each task.
+        The scorer should be closed after use (or used as context manager).
+
+        Args:
+            network (Network): The network.
+            num_workers (int|None): The number of worker processes.
+                If None, the number of CPUs is used.
+        """
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        self.network = network
+        self.num_workers = num_workers
+        arrays = {
+            'videos': network.videos,
+            'endpoint_latencies': network.endpoint_latencies,
+            'cache_latencies': network.cache_latencies,
+            'request_videos': network.request_videos,
+            'request_endpoints': network.request_endpoints,
+            'request_nums': network.request_nums,
+            'matrix': np.zeros(
+                (network.num_caches, network.num_videos), dtype=bool)}
+        self._shms = {}
+        self._arrays = {}
+        specs = {}
+        for name, arr in arrays.items():
+            arr = np.asarray(arr)
+            shm = shared_memory.SharedMemory(
+                create=True, size=max(arr.nbytes, 1))
+            self._shms[name] = shm
+            self._arrays[name] = np.ndarray(
+                arr.shape, dtype=arr.dtype, buffer=shm.buf)
+            self._arrays[name][...] = arr
+            specs[name] = shm.name, arr.shape, arr.dtype.str
+        bounds = np.linspace(
+            0, network.num_requests, num_workers + 1).astype(int)
+        self.chunks = [
+            (int(begin), int(end))
+            for begin, end in zip(bounds[:-1], bounds[1:]) if end > begin]
+        self._pool = multiprocessing.Pool(
+            num_workers, _scorer_init,
+            (specs, network.cache_size, network.total_requests))
+
+    # ----------------------------------------------------------
+    def score(self, caching):
+        """
+        Compute the score of a caching.
+
+        Args:
+            caching (Caching): The caching.
+
+        Returns:
+            score (int): The score.
+        """
+        matrix = self._arrays['matrix']
+        matrix[...] = False
+        matrix[caching.placements()] = True
+        gain = sum(self._pool.map(_score_par, self.chunks))
+        return int(gain / self.network.total_requests * 1000)
+
+    # ----------------------------------------------------------
+    def close(self):
+        """
+        Terminate the worker processes and release the shared memory.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._arrays = {}
+        for shm in self._shms.values():
+            shm.close()
+            shm.unlink()
+        self._shms = {}
+
+    # ----------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    # ----------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
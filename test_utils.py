@@ -17,7 +17,9 @@ import profile
 
 import numpy as np
 
-from quarkball.utils import Network, Caching
+import quarkball.utils as utils
+from quarkball.utils import (
+    Network, Caching, CachingBits, CachingEvaluator, ParallelScorer, _score)
 import quarkball.fill_caching as fill
 
 DIRPATH = 'data'
@@ -37,6 +39,39 @@ def test_network_input(
         print(network)
 
 
+# ======================================================================
+def test_network_bin(
+        in_dirpath=IN_DIRPATH,
+        source='me_at_the_zoo'):
+    in_filepath = os.path.join(in_dirpath, source + '.in')
+    network = Network.load(in_filepath, cached=False)
+    Network.load(in_filepath)
+    bin_network = Network.load(in_filepath)
+    print(bin_network)
+    assert bin_network.cache_size == network.cache_size
+    assert bin_network.requests == network.requests
+    for name in ('videos', 'endpoint_latencies', 'cache_latencies'):
+        assert np.array_equal(
+            getattr(bin_network, name), getattr(network, name))
+
+
+# ======================================================================
+def test_network_reduce(
+        in_dirpath=IN_DIRPATH,
+        source='me_at_the_zoo'):
+    in_filepath = os.path.join(in_dirpath, source + '.in')
+    network = Network.load(in_filepath)
+    reduced = network.reduce()
+    print(reduced)
+    caching = Caching(reduced.num_caches)
+    caching.fill(reduced)
+    expanded = reduced.expand_caching(caching)
+    assert expanded.validate(network.videos, network.cache_size)
+    assert caching.score(reduced) == expanded.score(network)
+    merged = reduced.merge_endpoints()
+    assert caching.score(merged) == expanded.score(network)
+
+
 # ======================================================================
 def test_caching_output(
         in_dirpath=OUT_DIRPATH,
@@ -61,6 +96,172 @@ def test_score(
     print(caching.score(network))
 
 
+# ======================================================================
+def test_caching_bits(
+        in_dirpath=IN_DIRPATH,
+        source='me_at_the_zoo'):
+    in_filepath = os.path.join(in_dirpath, source + '.in')
+    network = Network.load(in_filepath)
+    caching = Caching(network.num_caches)
+    caching.fill(network)
+    bits = CachingBits.from_caching(caching, network.num_videos)
+    print(bits)
+    assert bits.caches == caching.caches
+    assert bits.to_caching().caches == caching.caches
+    assert bits.score(network) == caching.score(network)
+    assert bits.validate(network.videos, network.cache_size)
+    other = CachingBits(network.num_caches, network.num_videos)
+    child = bits.crossover(other, [0])
+    assert not child.caches[0] and child.caches[1:] == caching.caches[1:]
+
+
+# ======================================================================
+def test_score_vectorized(
+        in_dirpath=IN_DIRPATH,
+        source='me_at_the_zoo'):
+    in_filepath = os.path.join(in_dirpath, source + '.in')
+    network = Network.load(in_filepath)
+    caching = Caching(network.num_caches)
+    caching.fill(network)
+    score = _score(
+        caching.caches, network.request_videos, network.request_endpoints,
+        network.request_nums, network.link_ptrs, network.link_caches,
+        network.link_latencies, network.endpoint_latencies,
+        network.total_requests)
+    print('Reference Score: {}'.format(score))
+    assert caching.score(network) == score
+    matrix = CachingBits.from_caching(caching, network.num_videos).matrix
+    assert network.score_matrix(matrix) == score
+
+
+# ======================================================================
+def test_score_many(
+        in_dirpath=IN_DIRPATH,
+        source='me_at_the_zoo',
+        pool_size=40):
+    in_filepath = os.path.join(in_dirpath, source + '.in')
+    network = Network.load(in_filepath)
+    pool = []
+    for _ in range(pool_size):
+        caching = CachingBits(network.num_caches, network.num_videos)
+        caching.fill(network)
+        pool.append(caching)
+    scores = [caching.score(network) for caching in pool]
+    print('Pool Scores: {}'.format(scores))
+    assert list(network.score_many(pool)) == scores
+    matrices = np.stack([caching.matrix for caching in pool])
+    assert list(network.score_many(matrices)) == scores
+    bits = np.stack([caching.bits for caching in pool])
+    assert list(network.score_many(bits, max_bytes=1)) == scores
+
+
+# ======================================================================
+def test_parallel_scorer(
+        in_dirpath=IN_DIRPATH,
+        source='me_at_the_zoo',
+        num_workers=2):
+    in_filepath = os.path.join(in_dirpath, source + '.in')
+    network = Network.load(in_filepath)
+    with ParallelScorer(network, num_workers) as scorer:
+        for _ in range(3):
+            caching = Caching(network.num_caches)
+            caching.fill(network)
+            score = scorer.score(caching)
+            print('Parallel Score: {}'.format(score))
+            assert score == caching.score(network)
+
+
+# ======================================================================
+def test_evaluator(
+        in_dirpath=IN_DIRPATH,
+        source='me_at_the_zoo',
+        num_moves=1000):
+    in_filepath = os.path.join(in_dirpath, source + '.in')
+    network = Network.load(in_filepath)
+    caching = Caching(network.num_caches)
+    caching.fill(network)
+    evaluator = CachingEvaluator(network, caching)
+    assert evaluator.score == caching.score(network)
+    for _ in range(num_moves):
+        cache = np.random.randint(network.num_caches)
+        video = np.random.randint(network.num_videos)
+        if evaluator.matrix[cache, video]:
+            delta = evaluator.delta_remove(cache, video)
+            assert evaluator.apply(cache, video, False) == delta
+        else:
+            delta = evaluator.delta_add(cache, video)
+            assert evaluator.apply(cache, video, True) == delta
+    print('Evaluator Score: {}'.format(evaluator.score))
+    assert evaluator.score == evaluator.to_caching().score(network)
+
+
+# ======================================================================
+def test_kernels(
+        in_dirpath=IN_DIRPATH,
+        source='me_at_the_zoo',
+        num_moves=200):
+    in_filepath = os.path.join(in_dirpath, source + '.in')
+    network = Network.load(in_filepath)
+    caching = Caching(network.num_caches)
+    caching.fill(network)
+    matrix = CachingBits.from_caching(caching, network.num_videos).matrix
+    gain = utils._gain_nb(matrix, *network.kernel_args)
+    assert int(gain / network.total_requests * 1000) == \
+        caching.score(network)
+    best_latencies = network.best_latencies(*caching.placements())
+    for _ in range(num_moves):
+        cache = np.random.randint(network.num_caches)
+        video = np.random.randint(network.num_videos)
+        for delta_nb, delta_np in (
+                (utils._delta_add_nb, utils._delta_add_np),
+                (utils._delta_remove_nb, utils._delta_remove_np)):
+            assert delta_nb(
+                cache, video, matrix, best_latencies, *network.kernel_args,
+                update=False) == delta_np(
+                cache, video, matrix, best_latencies, *network.kernel_args,
+                update=False)
+    utils._random_fill(matrix, np.arange(network.num_caches),
+                       network.videos, network.cache_size)
+    assert np.all(matrix.dot(network.videos) <= network.cache_size)
+
+
+# ======================================================================
+def test_threads(
+        in_dirpath=IN_DIRPATH,
+        out_dirpath=os.path.join(OUT_DIRPATH, 'threads'),
+        source='me_at_the_zoo',
+        max_iter=16):
+    if not os.path.isdir(out_dirpath):
+        os.makedirs(out_dirpath)
+    in_filepath = os.path.join(in_dirpath, source + '.in')
+    network = Network.load(in_filepath)
+    caching = fill.CachingRandomPar(network.num_caches)
+    caching.fill(network, threads=True)
+    assert caching.validate(network.videos, network.cache_size)
+    out_filepath = os.path.join(out_dirpath, source + '.out')
+    if os.path.isfile(out_filepath):
+        os.remove(out_filepath)
+    caching = fill.CachingMonteCarlo(network.num_caches)
+    caching.fill(network, out_filepath, max_iter, threads=True)
+    assert Caching.load(out_filepath).validate(
+        network.videos, network.cache_size)
+    out_filepath = os.path.join(out_dirpath, source + '_evolution.out')
+    evo_dirpath = os.path.splitext(out_filepath)[0]
+    for dirpath in (evo_dirpath, os.path.join(
+            out_dirpath, '_old_' + os.path.basename(evo_dirpath))):
+        shutil.rmtree(dirpath, ignore_errors=True)
+    caching = fill.CachingEvolution(network.num_caches)
+    caching.fill(
+        network, out_filepath, max_generations=3, pool_size=8,
+        threads=True)
+    assert caching.validate(network.videos, network.cache_size)
+    # the scores of the bred offspring are stored in the filenames
+    for name in os.listdir(evo_dirpath):
+        caching = Caching.load(os.path.join(evo_dirpath, name))
+        assert caching.validate(network.videos, network.cache_size)
+        assert caching.score(network) == int(name.split('_')[0])
+
+
 # ======================================================================
 def test_fill(
         in_dirpath=IN_DIRPATH,
@@ -190,14 +391,16 @@ def evolution(
         mutation_rate=0.05,
         mutation=0.1,
         elitism=0.005,
-        multiproc=True):
+        multiproc=True,
+        threads=False):
     print('Evolution')
     if not os.path.isdir(out_dirpath):
         os.makedirs(out_dirpath)
     test_method(
         in_dirpath, out_dirpath, source, fill.CachingEvolution,
         os.path.join(out_dirpath, source + '.out'), max_generations, pool_size,
-        selection, crossover, mutation_rate, mutation, elitism, multiproc)
+        selection, crossover, mutation_rate, mutation, elitism, multiproc,
+        threads)
 
 
 # ======================================================================